@@ -8,13 +8,24 @@ db = SQLAlchemy()
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     basedir = os.path.abspath(os.path.dirname(__file__))
     db_path = os.path.join(os.path.dirname(basedir), 'instance', 'slotly.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'your_secret_key_here'
+    # FLASK_* environment variables override the defaults, e.g. FLASK_PROXY_COUNT=1
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+
+    # Behind a reverse proxy, trust that many X-Forwarded-* hops so
+    # request.remote_addr (used by the rate limiter) is the real client
+    if app.config.get('PROXY_COUNT'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        count = app.config['PROXY_COUNT']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count, x_host=count)
 
     db.init_app(app)
     bcrypt.init_app(app)
@@ -30,6 +41,12 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(main_bp)
 
+    from . import forecast, archive
+    from .ratelimit import limiter
+    forecast.init_app(app)
+    archive.init_app(app)
+    limiter.init_app(app)
+
     return app
 
 from .models import User
@@ -37,3 +54,4 @@ from .models import User
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
+
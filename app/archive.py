@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from . import db
+from .models import Reservation, ArchivedReservation, ReservationRollup, ParkingSpot
+
+ARCHIVE_HORIZON_DAYS = 365
+BATCH_SIZE = 1000
+
+
+def _hours(r):
+    return (r.leaving_time - r.parking_time).total_seconds() / 3600
+
+
+def _month(moment):
+    return moment.date().replace(day=1)
+
+
+def archive_completed(horizon_days=ARCHIVE_HORIZON_DAYS, now=None, batch_size=BATCH_SIZE):
+    """Move completed reservations older than the horizon into the archive.
+
+    Each batch is copied, rolled up and deleted from the live table in one
+    transaction, so a crash never loses or double counts a reservation.
+    """
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=horizon_days)
+    moved = 0
+    while True:
+        rows = db.session.query(Reservation, ParkingSpot.lot_id) \
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+            .filter(Reservation.leaving_time.isnot(None), Reservation.leaving_time < cutoff) \
+            .order_by(Reservation.id).limit(batch_size).all()
+        if not rows:
+            return moved
+
+        deltas = {}
+        for r, lot_id in rows:
+            totals = deltas.setdefault((lot_id, _month(r.leaving_time)), [0, 0.0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += _hours(r)
+            totals[2] += r.cost_per_hour * _hours(r)
+            totals[3] += r.cost_per_hour
+            db.session.add(ArchivedReservation(
+                spot_id=r.spot_id,
+                user_id=r.user_id,
+                parking_time=r.parking_time,
+                leaving_time=r.leaving_time,
+                cost_per_hour=r.cost_per_hour,
+                archived_at=now
+            ))
+            db.session.delete(r)
+
+        for (lot_id, month), (count, hours, revenue, rate_total) in deltas.items():
+            rollup = ReservationRollup.query.filter_by(lot_id=lot_id, month=month).first()
+            if not rollup:
+                rollup = ReservationRollup(lot_id=lot_id, month=month, reservations=0,
+                                           hours=0, revenue=0, rate_total=0)
+                db.session.add(rollup)
+            rollup.reservations += count
+            rollup.hours += hours
+            rollup.revenue += revenue
+            rollup.rate_total += rate_total
+
+        db.session.commit()
+        moved += len(rows)
+
+
+def boundary():
+    """Latest leaving time in the archive; anything later is only in the live table"""
+    return db.session.query(func.max(ArchivedReservation.leaving_time)).scalar()
+
+
+def needs_archive(since):
+    """Whether a report covering `since` onwards has to look at archived data"""
+    latest = boundary()
+    return latest is not None and (since is None or since <= latest)
+
+
+def user_history(user_id, since=None):
+    """A user's reservations from the live table, plus archived ones if `since` reaches them"""
+    query = Reservation.query.filter_by(user_id=user_id)
+    if since:
+        query = query.filter(Reservation.parking_time >= since)
+    history = query.all()
+    if needs_archive(since):
+        archived = ArchivedReservation.query.filter_by(user_id=user_id)
+        if since:
+            archived = archived.filter(ArchivedReservation.parking_time >= since)
+        history.extend(archived.all())
+    history.sort(key=lambda r: r.parking_time, reverse=True)
+    return history
+
+
+def completed_since(since):
+    """Completed reservations that ended at or after `since`, archived ones included if needed"""
+    completed = Reservation.query.filter(
+        Reservation.leaving_time.isnot(None), Reservation.leaving_time >= since
+    ).all()
+    if needs_archive(since):
+        completed.extend(ArchivedReservation.query.filter(ArchivedReservation.leaving_time >= since).all())
+    completed.sort(key=lambda r: r.parking_time)
+    return completed
+
+
+def user_counts():
+    """Archived reservations per user as {user_id: count}, in one grouped query"""
+    query = db.session.query(
+        ArchivedReservation.user_id,
+        func.count(ArchivedReservation.id)
+    ).group_by(ArchivedReservation.user_id)
+    return dict(query.all())
+
+
+def references_spot(spot_id):
+    """Whether archived reservations still point at the spot, so it must not be deleted"""
+    return db.session.query(ArchivedReservation.id).filter_by(spot_id=spot_id).first() is not None
+
+
+def references_lot(lot_id):
+    """Whether archived reservations or rollups still point at the lot, so it must not be deleted"""
+    archived = db.session.query(ArchivedReservation.id) \
+        .join(ParkingSpot, ArchivedReservation.spot_id == ParkingSpot.id) \
+        .filter(ParkingSpot.lot_id == lot_id).first()
+    return archived is not None or ReservationRollup.query.filter_by(lot_id=lot_id).first() is not None
+
+
+def monthly_rollups(since=None):
+    """Archived totals per month as {month: (reservations, revenue)}"""
+    if not needs_archive(since):
+        return {}
+    query = db.session.query(
+        ReservationRollup.month,
+        func.sum(ReservationRollup.reservations),
+        func.sum(ReservationRollup.revenue)
+    ).group_by(ReservationRollup.month)
+    if since:
+        query = query.filter(ReservationRollup.month >= _month(since))
+    return {month: (count, revenue) for month, count, revenue in query.all()}
+
+
+def lot_rollups():
+    """Archived all-time totals per lot as {lot_id: (reservations, revenue, rate_total)}"""
+    query = db.session.query(
+        ReservationRollup.lot_id,
+        func.sum(ReservationRollup.reservations),
+        func.sum(ReservationRollup.revenue),
+        func.sum(ReservationRollup.rate_total)
+    ).group_by(ReservationRollup.lot_id)
+    return {lot_id: (count, revenue, rate_total) for lot_id, count, revenue, rate_total in query.all()}
+
+
+def init_app(app):
+    @app.cli.command('archive-reservations')
+    def archive_reservations_command():
+        """Move completed reservations older than ARCHIVE_HORIZON_DAYS into the archive."""
+        horizon = app.config.get('ARCHIVE_HORIZON_DAYS', ARCHIVE_HORIZON_DAYS)
+        moved = archive_completed(horizon)
+        print(f"Archived {moved} reservations older than {horizon} days.")
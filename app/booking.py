@@ -0,0 +1,194 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, text
+from . import db
+from .models import Reservation, ParkingSpot, ParkingLot
+
+MAX_BATCH_SPOTS = 50
+MAX_OCCURRENCES = 60
+
+# repeat option -> (step between occurrences, which days to keep)
+REPEAT_RULES = {
+    'daily': (timedelta(days=1), None),
+    'weekdays': (timedelta(days=1), lambda day: day.weekday() < 5),
+    'weekly': (timedelta(weeks=1), None),
+}
+
+
+def recurring_windows(start_time, end_time, repeat='none', occurrences=1):
+    """Expand a single time window into a recurring series of windows"""
+    if end_time <= start_time:
+        raise ValueError('End time must be after start time.')
+    if repeat == 'none':
+        return [(start_time, end_time)]
+    if repeat not in REPEAT_RULES:
+        raise ValueError('Unknown repeat option.')
+    if occurrences < 1 or occurrences > MAX_OCCURRENCES:
+        raise ValueError(f'Occurrences must be between 1 and {MAX_OCCURRENCES}.')
+
+    step, rule = REPEAT_RULES[repeat]
+    windows = []
+    offset = timedelta(0)
+    while len(windows) < occurrences:
+        start = start_time + offset
+        if rule is None or rule(start):
+            windows.append((start, end_time + offset))
+        offset += step
+    return windows
+
+
+def _overlaps(res_start, res_end, start, end):
+    # end=None is an open-ended booking; open-ended reservations block everything after they start
+    return (end is None or res_start < end) and (res_end is None or res_end > start)
+
+
+def _covers(start, end, now):
+    return start <= now and (end is None or now < end)
+
+
+def lock_lot(lot_id):
+    """Take the write lock before availability is read so concurrent bookings serialize"""
+    if db.engine.dialect.name == 'sqlite':
+        # pysqlite only sends BEGIN before the first write; once it has,
+        # this transaction already holds SQLite's write lock
+        if not db.session.connection().connection.dbapi_connection.in_transaction:
+            db.session.execute(text('BEGIN IMMEDIATE'))
+    else:
+        db.session.query(ParkingLot.id).filter_by(id=lot_id).with_for_update().first()
+
+
+def sync_status(lot_ids=None, now=None):
+    """Bring the 'A'/'O' flags in line with the reservations covering `now`.
+
+    A reservation booked for later only occupies its spot once its window
+    starts, and a timed one frees it when it ends; nothing else flips the
+    flag at those moments, so every path that reads it syncs first. Spots
+    held for the waitlist ('H') are left alone. Returns the spots changed;
+    the caller commits.
+    """
+    now = now or datetime.now()
+    live = db.session.query(Reservation.spot_id).filter(
+        Reservation.parking_time <= now,
+        or_(Reservation.leaving_time.is_(None), Reservation.leaving_time > now)
+    )
+    query = ParkingSpot.query.filter(or_(
+        and_(ParkingSpot.status == 'A', ParkingSpot.id.in_(live)),
+        and_(ParkingSpot.status == 'O', ParkingSpot.id.notin_(live))
+    ))
+    if lot_ids is not None:
+        query = query.filter(ParkingSpot.lot_id.in_(lot_ids))
+    stale = query.all()
+    for spot in stale:
+        spot.status = 'O' if spot.status == 'A' else 'A'
+    return stale
+
+
+def _busy_intervals(lot_id, span_start, span_end=None):
+    """Reservations in the lot overlapping the span, as {spot_id: [(start, end)]}"""
+    query = db.session.query(
+        Reservation.spot_id, Reservation.parking_time, Reservation.leaving_time
+    ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).filter(
+        ParkingSpot.lot_id == lot_id,
+        or_(Reservation.leaving_time.is_(None), Reservation.leaving_time > span_start)
+    )
+    if span_end is not None:
+        query = query.filter(Reservation.parking_time < span_end)
+    busy = {}
+    for spot_id, res_start, res_end in query.all():
+        busy.setdefault(spot_id, []).append((res_start, res_end))
+    return busy
+
+
+def _is_free(spot, intervals, start, end, now):
+    if any(_overlaps(s, e, start, end) for s, e in intervals):
+        return False
+    # The status flag describes right now: occupied, or held for the waitlist
+    return spot.status == 'A' or not _covers(start, end, now)
+
+
+def find_free_spots(lot, start, end=None, count=1, now=None):
+    """Spots in `lot` with no reservation overlapping [start, end).
+
+    Takes the lot's write lock first, so the caller can book the returned
+    spots and commit without another request grabbing them in between.
+    """
+    now = now or datetime.now()
+    lock_lot(lot.id)
+    sync_status([lot.id], now)
+    spots = ParkingSpot.query.filter_by(lot_id=lot.id).order_by(ParkingSpot.id).all()
+    busy = _busy_intervals(lot.id, start, end)
+    free = [spot for spot in spots if _is_free(spot, busy.get(spot.id, ()), start, end, now)]
+    return free[:count]
+
+
+def has_conflict(spot, start, end=None):
+    """Whether any reservation on `spot` overlaps [start, end); call after lock_lot()"""
+    return bool(_busy_intervals(spot.lot_id, start, end).get(spot.id))
+
+
+def _reserve(user_id, lot, spot, start, end, now):
+    if _covers(start, end, now):
+        spot.status = 'O'
+    return Reservation(
+        spot_id=spot.id,
+        user_id=user_id,
+        parking_time=start,
+        leaving_time=end,
+        cost_per_hour=lot.price_per_hour
+    )
+
+
+def book_one(user_id, lot, start=None, end=None, now=None):
+    """Book one spot for [start, end), starting now and open-ended by default.
+
+    Shared by book_spot and book_confirm. Returns None without committing
+    when no spot is free, so the caller can queue the user instead.
+    """
+    now = now or datetime.now()
+    start = start or now
+    free = find_free_spots(lot, start, end, 1, now)
+    if not free:
+        return None
+    reservation = _reserve(user_id, lot, free[0], start, end, now)
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation
+
+
+def book_batch(user_id, lot, windows, count=1, now=None):
+    """Reserve `count` spots in `lot` for every window in one transaction.
+
+    Availability for the whole series is checked with a single query over
+    the lot's overlapping reservations, under the lot's write lock. Either
+    every reservation is created or none is and a ValueError explains why.
+    """
+    if count < 1 or count > MAX_BATCH_SPOTS:
+        raise ValueError(f'Number of spots must be between 1 and {MAX_BATCH_SPOTS}.')
+    if not windows:
+        raise ValueError('No time windows to book.')
+    now = now or datetime.now()
+
+    lock_lot(lot.id)
+    sync_status([lot.id], now)
+    spots = ParkingSpot.query.filter_by(lot_id=lot.id).order_by(ParkingSpot.id).all()
+    if len(spots) < count:
+        db.session.rollback()
+        raise ValueError(f'{lot.prime_location_name} only has {len(spots)} spots.')
+
+    busy = _busy_intervals(lot.id, min(start for start, _ in windows), max(end for _, end in windows))
+
+    reservations = []
+    for start, end in windows:
+        free = [spot for spot in spots if _is_free(spot, busy.get(spot.id, ()), start, end, now)]
+        if len(free) < count:
+            db.session.rollback()
+            raise ValueError(
+                f'Only {len(free)} spots free on {start.strftime("%d %b %Y %H:%M")}; '
+                f'no reservations were made.'
+            )
+        for spot in free[:count]:
+            busy.setdefault(spot.id, []).append((start, end))
+            reservations.append(_reserve(user_id, lot, spot, start, end, now))
+
+    db.session.add_all(reservations)
+    db.session.commit()
+    return reservations
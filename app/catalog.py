@@ -0,0 +1,34 @@
+from sqlalchemy import case, func
+from . import db, forecast
+from .models import ParkingLot, ParkingSpot
+
+
+def availability_counts(lot_ids=None):
+    """Total and free spots per lot in a single aggregate query"""
+    query = db.session.query(
+        ParkingSpot.lot_id,
+        func.count(ParkingSpot.id),
+        func.sum(case((ParkingSpot.status == 'A', 1), else_=0))
+    ).group_by(ParkingSpot.lot_id)
+    if lot_ids is not None:
+        query = query.filter(ParkingSpot.lot_id.in_(lot_ids))
+    return {lot_id: (total, free or 0) for lot_id, total, free in query.all()}
+
+
+def prepare_worker(app):
+    """Warm a worker before it serves requests.
+
+    Runs the lot catalogue and availability queries once, so SQLite's pages
+    are cached and SQLAlchemy has compiled the statements, and loads the
+    forecast profiles into memory. The query results are not kept: counts
+    change with every booking and workers share no memory, so the
+    dashboard always reads them fresh. The engine is disposed afterwards
+    so a server that forks after import (gunicorn --preload) does not hand
+    the same SQLite connection to every worker.
+    """
+    with app.app_context():
+        ParkingLot.query.all()
+        availability_counts()
+        forecast.load_profiles(app)
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from . import db
+from .models import Reservation, ParkingSpot
+
+# One slot per (day of week, hour): index = weekday * 24 + hour
+SLOTS_PER_WEEK = 7 * 24
+FORECAST_HOURS = 6
+# How often a running worker checks whether build-forecasts rewrote the file
+RELOAD_CHECK_SECONDS = 30
+
+# lot_id -> array of expected occupied spots per weekly slot
+_profiles = {}
+_loaded_mtime = None
+_checked_at = None
+
+
+def _slot(moment):
+    return moment.weekday() * 24 + moment.hour
+
+
+def _forecast_path(app):
+    return os.path.join(app.instance_path, 'lot_forecasts.json')
+
+
+def build_profiles(now=None):
+    """Aggregate reservation history into day-of-week x hour occupancy per lot"""
+    now = now or datetime.now()
+    rows = db.session.query(
+        ParkingSpot.lot_id, Reservation.parking_time, Reservation.leaving_time
+    ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).all()
+
+    occupied = {}
+    first_seen = {}
+    for lot_id, start, end in rows:
+        # Open reservations count as occupied up to now
+        end = min(end or now, now)
+        if not start or end <= start:
+            continue
+        totals = occupied.setdefault(lot_id, [0.0] * SLOTS_PER_WEEK)
+        first_seen[lot_id] = min(first_seen.get(lot_id, start), start)
+        cursor = start
+        while cursor < end:
+            hour_end = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            chunk_end = min(hour_end, end)
+            totals[_slot(cursor)] += (chunk_end - cursor).total_seconds() / 3600
+            cursor = chunk_end
+
+    profiles = {}
+    for lot_id, totals in occupied.items():
+        # Average over the number of weeks the lot has history for
+        weeks = max(1.0, (now - first_seen[lot_id]).total_seconds() / (7 * 24 * 3600))
+        profiles[lot_id] = array('f', (t / weeks for t in totals))
+    return profiles
+
+
+def save_profiles(app, profiles):
+    os.makedirs(app.instance_path, exist_ok=True)
+    data = {str(lot_id): [round(v, 3) for v in profile] for lot_id, profile in profiles.items()}
+    # Write then rename so workers never read a half-written file
+    path = _forecast_path(app)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def load_profiles(app):
+    global _loaded_mtime, _checked_at
+    path = _forecast_path(app)
+    _checked_at = time.monotonic()
+    _loaded_mtime = _mtime(path)
+    profiles = {}
+    if _loaded_mtime is not None:
+        with open(path) as f:
+            data = json.load(f)
+        for lot_id, profile in data.items():
+            if len(profile) == SLOTS_PER_WEEK:
+                profiles[int(lot_id)] = array('f', profile)
+    _profiles.clear()
+    _profiles.update(profiles)
+
+
+def _refresh(app):
+    # Loaded by catalog.prepare_worker() or on first use, then reloaded
+    # whenever build-forecasts replaces the file
+    global _checked_at
+    if _checked_at is None:
+        load_profiles(app)
+    elif time.monotonic() - _checked_at >= RELOAD_CHECK_SECONDS:
+        _checked_at = time.monotonic()
+        if _mtime(_forecast_path(app)) != _loaded_mtime:
+            load_profiles(app)
+
+
+def booked_occupancy(lot_ids, now=None, hours=FORECAST_HOURS):
+    """Spots already booked at each of the next `hours` hours, as {lot_id: array}.
+
+    One query over the reservations overlapping the forecast window, batch
+    and open-ended ones included; lots with nothing booked are left out.
+    """
+    now = now or datetime.now()
+    first = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    last = first + timedelta(hours=hours - 1)
+    rows = db.session.query(
+        ParkingSpot.lot_id, Reservation.parking_time, Reservation.leaving_time
+    ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).filter(
+        ParkingSpot.lot_id.in_(lot_ids),
+        Reservation.parking_time <= last,
+        or_(Reservation.leaving_time.is_(None), Reservation.leaving_time > first)
+    ).all()
+    booked = {}
+    for lot_id, start, end in rows:
+        counts = booked.setdefault(lot_id, array('f', [0.0] * hours))
+        for i in range(hours):
+            moment = first + timedelta(hours=i)
+            if start <= moment and (end is None or moment < end):
+                counts[i] += 1
+    return booked
+
+
+def predict_free_spots(lot_id, total_spots, now=None, hours=FORECAST_HOURS, booked=None):
+    """Expected free spots for the next `hours` hours as (hour, free) pairs.
+
+    `booked` is the lot's entry from booked_occupancy(); spots already
+    booked for an hour are never forecast as free, whatever the history says.
+    """
+    _refresh(current_app)
+    profile = _profiles.get(lot_id)
+    if profile is None and booked is None:
+        return []
+    now = now or datetime.now()
+    start = now.replace(minute=0, second=0, microsecond=0)
+    forecast = []
+    for i in range(1, hours + 1):
+        moment = start + timedelta(hours=i)
+        expected = profile[_slot(moment)] if profile is not None else 0
+        if booked is not None:
+            expected = max(expected, booked[i - 1])
+        free = max(0, int(round(total_spots - expected)))
+        forecast.append((moment, free))
+    return forecast
+
+
+def likely_full_at(lot_id, total_spots, now=None, hours=FORECAST_HOURS, booked=None):
+    for moment, free in predict_free_spots(lot_id, total_spots, now, hours, booked):
+        if free == 0:
+            return moment
+    return None
+
+
+def init_app(app):
+    @app.cli.command('build-forecasts')
+    def build_forecasts_command():
+        """Rebuild per-lot occupancy forecasts from reservation history."""
+        profiles = build_profiles()
+        save_profiles(app, profiles)
+        print(f"Built forecasts for {len(profiles)} lots.")
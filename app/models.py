@@ -30,12 +30,13 @@ class ParkingLot(db.Model):
     max_spots = db.Column(db.Integer, nullable=False)
     
     spots = db.relationship("ParkingSpot", backref="lot", lazy=True)
+    waitlist = db.relationship("WaitlistEntry", backref="lot", lazy=True)
 
 # parking spot
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
-    status = db.Column(db.String(1), nullable=False, default='A')  # 'A' or 'O'
+    status = db.Column(db.String(1), nullable=False, default='A')  # 'A', 'O' or 'H' (held for waitlist)
     
     reservations = db.relationship("Reservation", backref="spot", lazy=True)
 
@@ -47,3 +48,41 @@ class Reservation(db.Model):
     parking_time = db.Column(db.DateTime, nullable=False)
     leaving_time = db.Column(db.DateTime)
     cost_per_hour = db.Column(db.Float, nullable=False)
+
+# waitlist for full lots
+class WaitlistEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    status = db.Column(db.String(1), nullable=False, default='W')  # 'W' waiting, 'H' holding, 'C' claimed, 'X' expired/left
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'))
+    hold_expires_at = db.Column(db.DateTime)
+
+    user = db.relationship("User")
+    spot = db.relationship("ParkingSpot")
+
+# completed reservations moved out of the live table by app.archive
+class ArchivedReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    parking_time = db.Column(db.DateTime, nullable=False)
+    leaving_time = db.Column(db.DateTime, nullable=False, index=True)
+    cost_per_hour = db.Column(db.Float, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    user = db.relationship("User")
+    spot = db.relationship("ParkingSpot")
+
+# monthly per-lot totals for archived reservations, by leaving time
+class ReservationRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Float, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    rate_total = db.Column(db.Float, nullable=False, default=0)  # sum of cost_per_hour, as shown in the admin summary
+
+    __table_args__ = (db.UniqueConstraint('lot_id', 'month'),)
@@ -0,0 +1,197 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request
+from flask_login import current_user
+
+
+class MemoryBackend:
+    """Token buckets kept in this process; each worker limits on its own.
+
+    When more than MAX_KEYS buckets exist, one sweep drops every bucket that
+    has refilled by its own rate and capacity. If that is not enough, the
+    least recently used buckets are evicted down to LOW_WATER. The next
+    sweep then waits for the table to grow again, so the cost per call
+    stays O(1) amortized.
+    """
+    MAX_KEYS = 10000
+    LOW_WATER = 0.9
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity, now):
+        with self._lock:
+            tokens, last, _, _ = self._buckets.pop(key, (capacity, now, rate, capacity))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, rate, capacity)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        for key, (tokens, last, rate, capacity) in list(self._buckets.items()):
+            if tokens + (now - last) * rate >= capacity:
+                del self._buckets[key]
+        while len(self._buckets) > self.MAX_KEYS * self.LOW_WATER:
+            self._buckets.popitem(last=False)
+
+
+class SqliteBackend:
+    """Token buckets shared by every worker on the host through a SQLite file.
+
+    Stands in for a shared store such as Redis; any object with the same
+    consume() method can be passed to RateLimiter.init_app(). If the file
+    stays locked past `timeout` the request is let through (fail open), so
+    a contended limiter never turns into a 500.
+    """
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path, timeout=0.05):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS token_bucket (key TEXT PRIMARY KEY, tokens REAL, '
+                         'updated REAL, rate REAL, capacity REAL)')
+            self._local.conn = conn
+            self._local.calls = 0
+        return conn
+
+    def consume(self, key, rate, capacity, now):
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return True, 0
+        try:
+            row = conn.execute('SELECT tokens, updated FROM token_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, last = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO token_bucket (key, tokens, updated, rate, capacity) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, tokens, now, rate, capacity))
+            self._local.calls += 1
+            if self._local.calls % self.CLEANUP_EVERY == 0:
+                # Buckets that have refilled completely carry no state worth keeping
+                conn.execute('DELETE FROM token_bucket WHERE tokens + (? - updated) * rate >= capacity', (now,))
+            conn.execute('COMMIT')
+        except sqlite3.OperationalError:
+            conn.execute('ROLLBACK')
+            return True, 0
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    # Account buckets allow this many times the per-IP rate and burst, so a
+    # single client runs into its own IP limit long before it can drain a
+    # victim's account bucket. The trade-off: attackers spread over more
+    # than ACCOUNT_FACTOR addresses can still lock an account out, in
+    # exchange for capping distributed guessing against one account.
+    ACCOUNT_FACTOR = 6
+
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.enabled = True
+        self._semaphores = {}
+
+    def init_app(self, app, backend=None):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        if backend is not None:
+            self.backend = backend
+        elif app.config.get('RATELIMIT_BACKEND') == 'sqlite':
+            self.backend = SqliteBackend(os.path.join(app.instance_path, 'ratelimit.db'))
+        else:
+            self.backend = MemoryBackend()
+
+    def _buckets(self, name, per_minute, burst, account=None):
+        # remote_addr is only the client's address behind a proxy if
+        # PROXY_COUNT is configured (see create_app)
+        buckets = [(f'{name}:ip:{request.remote_addr}', per_minute, burst)]
+        if current_user.is_authenticated:
+            buckets.append((f'{name}:user:{current_user.id}', per_minute, burst))
+        elif account is not None:
+            value = account()
+            if value:
+                buckets.append((f'{name}:account:{value.strip().lower()}',
+                                per_minute * self.ACCOUNT_FACTOR, burst * self.ACCOUNT_FACTOR))
+        return buckets
+
+    def hit(self, name, per_minute, burst, account=None):
+        """Take a token for the current user and IP; return seconds to wait if denied"""
+        now = time.time()
+        for key, key_per_minute, key_burst in self._buckets(name, per_minute, burst, account):
+            allowed, retry_after = self.backend.consume(key, key_per_minute / 60.0, key_burst, now)
+            if not allowed:
+                # Stop at the IP bucket, so a flood from one client never
+                # drains the account bucket behind it
+                return retry_after
+        return 0
+
+    def limit(self, name, per_minute, burst, when=None, account=None):
+        """Token-bucket limit keyed by user and IP; `when` restricts it to some requests.
+
+        `account` returns the account an anonymous request acts on, such as
+        the email submitted to login. Anyone can name any account, so its
+        bucket is ACCOUNT_FACTOR times looser than the per-IP one.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if self.enabled and (when is None or when()):
+                    wait = self.hit(name, per_minute, burst, account)
+                    if wait:
+                        return ('Too many requests. Please slow down.', 429,
+                                {'Retry-After': str(math.ceil(wait))})
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    def concurrency(self, name, max_in_flight, when=None):
+        """Reject with 503 instead of queuing once `max_in_flight` requests are running"""
+        semaphore = self._semaphores.setdefault(name, threading.BoundedSemaphore(max_in_flight))
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if not self.enabled or (when is not None and not when()):
+                    return view(*args, **kwargs)
+                if not semaphore.acquire(blocking=False):
+                    return ('Server busy. Please try again shortly.', 503, {'Retry-After': '1'})
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    semaphore.release()
+            return wrapped
+        return decorator
+
+
+limiter = RateLimiter()
+
+
+def is_post():
+    return request.method == 'POST'
+
+
+def login_email():
+    return request.form.get('email')
+
+
+def has_search():
+    return bool(request.args.get('search'))
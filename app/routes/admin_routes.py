@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, session
-from .. import db
+from .. import db, archive
+from ..booking import sync_status
 from ..models import ParkingLot, ParkingSpot, User, Reservation
 
 admin_bp = Blueprint('admin_bp', __name__)
@@ -15,6 +16,8 @@ def admin_dashboard():
         ).all()
     else:
         lots = ParkingLot.query.all()
+    if sync_status():
+        db.session.commit()
     spots = ParkingSpot.query.all()
     users = User.query.all()
     reservations = Reservation.query.all()
@@ -23,7 +26,9 @@ def admin_dashboard():
 @admin_bp.route('/admin/users')
 def admin_users():
     users = User.query.all()
-    return render_template('admin_users.html', users=users)
+    # Archived reservations still count towards each user's total
+    archived_counts = archive.user_counts()
+    return render_template('admin_users.html', users=users, archived_counts=archived_counts)
 
 @admin_bp.route('/admin/sales')
 def admin_sales():
@@ -37,19 +42,20 @@ def admin_sales():
             hours = (r.leaving_time - r.parking_time).total_seconds() / 3600
             total_sales_all_time += r.cost_per_hour * hours
     
+    # Archived reservations only contribute through their monthly rollups
+    archived = archive.monthly_rollups()
+    total_sales_all_time += sum(revenue for _, revenue in archived.values())
+    
     # Calculate total sales of current month
     now = datetime.now()
     start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
-    total_sales_this_month = 0
+    total_sales_this_month = archived.get(start_of_month.date(), (0, 0))[1]
     for r in reservations:
         if r.leaving_time and r.parking_time and start_of_month <= r.leaving_time <= end_of_month:
             hours = (r.leaving_time - r.parking_time).total_seconds() / 3600
             total_sales_this_month += r.cost_per_hour * hours
     
-    # Get completed reservations for table
-    completed_reservations = [r for r in reservations if r.leaving_time]
-    
     # Prepare chart data for last 12 months
     chart_labels = []
     chart_sales_data = []
@@ -59,9 +65,14 @@ def admin_sales():
         month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
         month_reservations = [r for r in reservations if r.leaving_time and r.parking_time and month_start <= r.leaving_time <= month_end]
         month_sales = sum(r.cost_per_hour * ((r.leaving_time - r.parking_time).total_seconds() / 3600) for r in month_reservations)
+        archived_count, archived_sales = archived.get(month_start.date(), (0, 0))
         chart_labels.append(month_start.strftime('%b %Y'))
-        chart_sales_data.append(month_sales)
-        chart_reservation_counts.append(len(month_reservations))
+        chart_sales_data.append(month_sales + archived_sales)
+        chart_reservation_counts.append(len(month_reservations) + archived_count)
+    
+    # Completed reservations in the chart window for the table, archived ones included
+    chart_start = (now - timedelta(days=30*11)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    completed_reservations = archive.completed_since(chart_start)
     
     return render_template('admin_sales.html', 
                          total_sales_all_time=round(total_sales_all_time, 2),
@@ -73,12 +84,16 @@ def admin_sales():
 
 @admin_bp.route('/admin/summary')
 def admin_summary():
+    if sync_status():
+        db.session.commit()
     lots = ParkingLot.query.all()
+    archived = archive.lot_rollups()
     summary = []
     for lot in lots:
         open_spots = sum(1 for s in lot.spots if s.status == 'A')
         reserved_spots = sum(1 for s in lot.spots if s.status == 'O')
         revenue = sum(r.cost_per_hour for s in lot.spots for r in s.reservations if r.leaving_time)
+        revenue += archived.get(lot.id, (0, 0, 0))[2]
         summary.append({
             'lot_name': lot.prime_location_name,
             'total_spots': lot.max_spots,
@@ -130,6 +145,9 @@ def update_lot(lot_id):
 @admin_bp.route('/admin/delete_lot/<int:lot_id>', methods=['POST'])
 def delete_lot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
+    if archive.references_lot(lot.id):
+        flash('This lot has archived reservations and cannot be deleted.', 'danger')
+        return redirect(url_for('admin_bp.admin_dashboard'))
     db.session.delete(lot)
     db.session.commit()
     flash('Parking lot deleted successfully!', 'success')
@@ -163,6 +181,9 @@ def update_spot(spot_id):
 @admin_bp.route('/admin/delete_spot/<int:spot_id>', methods=['POST'])
 def delete_spot(spot_id):
     spot = ParkingSpot.query.get_or_404(spot_id)
+    if archive.references_spot(spot.id):
+        flash('This spot has archived reservations and cannot be deleted.', 'danger')
+        return redirect(url_for('admin_bp.admin_dashboard'))
     db.session.delete(spot)
     db.session.commit()
     flash('Parking spot deleted successfully!', 'success')
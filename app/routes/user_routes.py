@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
-from .. import db, bcrypt
-from ..models import User, Reservation, ParkingLot, ParkingSpot
+from .. import db, bcrypt, forecast, waitlist, archive
+from ..catalog import availability_counts
+from ..ratelimit import limiter, is_post, has_search, login_email
+from ..booking import book_one, book_batch, recurring_windows, lock_lot, has_conflict, sync_status
+from ..models import User, Reservation, ParkingLot, ParkingSpot, WaitlistEntry
 from ..forms import RegistrationForm, LoginForm
 from datetime import datetime
 
@@ -28,6 +31,7 @@ def register():
     return render_template('register.html', form=form)
 
 @user_bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', per_minute=10, burst=5, when=is_post, account=login_email)
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -42,6 +46,7 @@ def login():
 
 @user_bp.route('/dashboard')
 @login_required
+@limiter.limit('search', per_minute=60, burst=20, when=has_search)
 def dashboard():
     # Get search query
     search_query = request.args.get('search', '')
@@ -56,10 +61,18 @@ def dashboard():
     else:
         lots = ParkingLot.query.all()
     
-    # Calculate available spots for each lot
+    # Calculate available spots for each lot, once the flags match the reservations live now
+    lot_ids = [lot.id for lot in lots]
+    if sync_status(lot_ids):
+        db.session.commit()
+    counts = availability_counts(lot_ids)
+    booked = forecast.booked_occupancy(lot_ids)
     available_spots = {}
+    full_at = {}
     for lot in lots:
-        available_spots[lot.id] = sum(1 for spot in lot.spots if spot.status == 'A')
+        total, available_spots[lot.id] = counts.get(lot.id, (0, 0))
+        # Precomputed occupancy forecast served from memory, never below what is already booked
+        full_at[lot.id] = forecast.likely_full_at(lot.id, total, booked=booked.get(lot.id))
     
     # Get active reservations (not released yet)
     from datetime import datetime
@@ -70,8 +83,23 @@ def dashboard():
         Reservation.leaving_time > now
     ).all()
     
-    # Get all user's reservation history
-    all_reservations = Reservation.query.filter_by(user_id=current_user.id).order_by(Reservation.parking_time.desc()).all()
+    # Get all user's reservation history, including archived reservations
+    all_reservations = archive.user_history(current_user.id)
+    
+    # Pass on lapsed holds in the user's queues; holders who never come back would otherwise block them
+    entry_lots = db.session.query(WaitlistEntry.lot_id).filter(
+        WaitlistEntry.user_id == current_user.id,
+        WaitlistEntry.status.in_(['W', 'H'])
+    ).distinct().all()
+    if sum(waitlist.expire_holds(lot_id, now) for lot_id, in entry_lots):
+        db.session.commit()
+    
+    # Waitlist entries still waiting or holding a spot
+    waitlist_entries = WaitlistEntry.query.filter(
+        WaitlistEntry.user_id == current_user.id,
+        WaitlistEntry.status.in_(['W', 'H'])
+    ).all()
+    waitlist_positions = {e.id: waitlist.position(e) for e in waitlist_entries if e.status == 'W'}
     
     # Calculate analytics data
     analytics = calculate_user_analytics(current_user.id, all_reservations)
@@ -79,6 +107,10 @@ def dashboard():
     return render_template('user_dashboard.html', 
                          lots=lots, 
                          available_spots=available_spots,
+                         full_at=full_at,
+                         waitlist_entries=waitlist_entries,
+                         waitlist_positions=waitlist_positions,
+                         now=now,
                          active_reservations=active_reservations,
                          history=all_reservations,
                          analytics=analytics)
@@ -161,26 +193,32 @@ def calculate_user_analytics(user_id, reservations):
         'top_hours': sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:6]
     }
 
+def join_waitlist(lot):
+    # Queue the user instead of making them refresh until a spot frees up
+    entry = waitlist.join(current_user.id, lot)
+    db.session.commit()
+    if not entry:
+        flash('No available spots and the waitlist for this lot is full.', 'danger')
+    elif entry.status == 'H':
+        flash('A spot is already being held for you. Claim it from your dashboard.', 'info')
+    else:
+        flash(f'No available spots. You are #{waitlist.position(entry)} on the waitlist.', 'info')
+    return redirect(url_for('user_bp.dashboard'))
+
 @user_bp.route('/book/<int:lot_id>', methods=['POST'])
 @login_required
+@limiter.limit('booking', per_minute=20, burst=10)
+@limiter.concurrency('booking', max_in_flight=4)
 def book_spot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
-    # Find an available spot
-    spot = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').first()
-    if not spot:
-        flash('No available spots in this lot.', 'danger')
-        return redirect(url_for('user_bp.dashboard'))
-    # Mark spot as occupied
-    spot.status = 'O'
-    # Create reservation
-    reservation = Reservation(
-        spot_id=spot.id,
-        user_id=current_user.id,
-        parking_time=datetime.now(),
-        cost_per_hour=lot.price_per_hour
-    )
-    db.session.add(reservation)
-    db.session.commit()
+    # Return spots from lapsed waitlist holds before looking
+    waitlist.expire_holds(lot.id)
+    # Book a spot that is free now and has no later reservation
+    reservation = book_one(current_user.id, lot)
+    if not reservation:
+        return join_waitlist(lot)
+    if waitlist.parked(current_user.id, lot.id, [reservation]):
+        db.session.commit()
     flash(f'Successfully booked a spot in {lot.prime_location_name}!', 'success')
     return redirect(url_for('user_bp.dashboard'))
 
@@ -204,7 +242,8 @@ def release_reservation():
         return redirect(url_for('user_bp.dashboard'))
     reservation.leaving_time = datetime.now()
     spot = ParkingSpot.query.get(reservation.spot_id)
-    spot.status = 'A'
+    waitlist.expire_holds(spot.lot_id)
+    waitlist.hand_off(spot)
     db.session.commit()
     flash('Reservation released successfully.', 'success')
     return redirect(url_for('user_bp.dashboard'))
@@ -222,7 +261,8 @@ def release_confirm():
         end_time_str = request.form.get('end_time')
         end_time = datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M")
         reservation.leaving_time = end_time
-        spot.status = 'A'
+        waitlist.expire_holds(spot.lot_id)
+        waitlist.hand_off(spot)
         db.session.commit()
         flash('Reservation released successfully.', 'success')
         return redirect(url_for('user_bp.dashboard'))
@@ -230,6 +270,8 @@ def release_confirm():
 
 @user_bp.route('/book/<int:lot_id>/confirm', methods=['GET', 'POST'])
 @login_required
+@limiter.limit('booking', per_minute=20, burst=10, when=is_post)
+@limiter.concurrency('booking', max_in_flight=4, when=is_post)
 def book_confirm(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     if request.method == 'POST':
@@ -237,25 +279,78 @@ def book_confirm(lot_id):
         end_time_str = request.form.get('end_time')
         start_time = datetime.strptime(start_time_str, "%Y-%m-%dT%H:%M")
         end_time = datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M")
-        # Find an available spot
-        spot = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').first()
-        if not spot:
-            flash('No available spots in this lot.', 'danger')
+        waitlist.expire_holds(lot.id)
+        # Find a spot with no reservation overlapping the requested window
+        reservation = book_one(current_user.id, lot, start_time, end_time)
+        if not reservation:
+            # The waitlist hands out open-ended spots starting at once, not a chosen window
+            flash('No spot is free for the whole of that time. Try another time or lot.', 'danger')
             return redirect(url_for('user_bp.dashboard'))
-        spot.status = 'O'
-        reservation = Reservation(
-            spot_id=spot.id,
-            user_id=current_user.id,
-            parking_time=start_time,
-            leaving_time=end_time,
-            cost_per_hour=lot.price_per_hour
-        )
-        db.session.add(reservation)
-        db.session.commit()
+        if waitlist.parked(current_user.id, lot.id, [reservation]):
+            db.session.commit()
         flash(f'Successfully booked a spot in {lot.prime_location_name}!', 'success')
         return redirect(url_for('user_bp.dashboard'))
     return render_template('book_confirm.html', lot=lot)
 
+@user_bp.route('/book/<int:lot_id>/batch', methods=['GET', 'POST'])
+@login_required
+@limiter.limit('booking', per_minute=20, burst=10, when=is_post)
+@limiter.concurrency('booking', max_in_flight=4, when=is_post)
+def book_batch_confirm(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    if request.method == 'POST':
+        try:
+            start_time = datetime.strptime(request.form.get('start_time'), "%Y-%m-%dT%H:%M")
+            end_time = datetime.strptime(request.form.get('end_time'), "%Y-%m-%dT%H:%M")
+            count = int(request.form.get('count', 1))
+            occurrences = int(request.form.get('occurrences', 1))
+        except (TypeError, ValueError):
+            flash('Invalid booking details.', 'danger')
+            return render_template('book_batch.html', lot=lot)
+        try:
+            windows = recurring_windows(start_time, end_time, request.form.get('repeat', 'none'), occurrences)
+            reservations = book_batch(current_user.id, lot, windows, count)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('book_batch.html', lot=lot)
+        if waitlist.parked(current_user.id, lot.id, reservations):
+            db.session.commit()
+        flash(f'Successfully booked {len(reservations)} reservations in {lot.prime_location_name}!', 'success')
+        return redirect(url_for('user_bp.dashboard'))
+    return render_template('book_batch.html', lot=lot)
+
+@user_bp.route('/waitlist/<int:entry_id>/claim', methods=['POST'])
+@login_required
+@limiter.limit('booking', per_minute=20, burst=10)
+@limiter.concurrency('booking', max_in_flight=4)
+def claim_waitlist(entry_id):
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    if entry.user_id != current_user.id:
+        flash('Invalid waitlist entry or permission denied.', 'danger')
+        return redirect(url_for('user_bp.dashboard'))
+    try:
+        waitlist.claim(entry)
+    except ValueError as e:
+        waitlist.expire_holds(entry.lot_id)
+        db.session.commit()
+        flash(str(e), 'warning')
+        return redirect(url_for('user_bp.dashboard'))
+    db.session.commit()
+    flash(f'Successfully booked a spot in {entry.lot.prime_location_name}!', 'success')
+    return redirect(url_for('user_bp.dashboard'))
+
+@user_bp.route('/waitlist/<int:entry_id>/leave', methods=['POST'])
+@login_required
+def leave_waitlist(entry_id):
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    if entry.user_id != current_user.id or entry.status not in ('W', 'H'):
+        flash('Invalid waitlist entry or permission denied.', 'danger')
+        return redirect(url_for('user_bp.dashboard'))
+    waitlist.leave(entry)
+    db.session.commit()
+    flash('You have left the waitlist.', 'info')
+    return redirect(url_for('user_bp.dashboard'))
+
 @user_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
@@ -328,6 +423,13 @@ def extend_reservation(reservation_id):
         if new_end <= reservation.leaving_time:
             flash('New end time must be after current end time.', 'danger')
             return render_template('extend_reservation.html', reservation=reservation)
+        # Spots take back-to-back timed bookings, so the added time must be free
+        lock_lot(reservation.spot.lot_id)
+        db.session.refresh(reservation)
+        if has_conflict(reservation.spot, reservation.leaving_time, new_end):
+            db.session.rollback()
+            flash('The spot is reserved by someone else during the extra time.', 'danger')
+            return render_template('extend_reservation.html', reservation=reservation)
         reservation.leaving_time = new_end
         db.session.commit()
         flash('Reservation extended successfully!', 'success')
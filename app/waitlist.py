@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from . import db
+from .booking import lock_lot, find_free_spots, has_conflict
+from .models import WaitlistEntry, Reservation
+
+HOLD_MINUTES = 10
+MAX_WAITLIST = 100
+
+# None of these helpers commit; callers commit them with the rest of the request
+
+
+def active_entry(user_id, lot_id):
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.user_id == user_id,
+        WaitlistEntry.lot_id == lot_id,
+        WaitlistEntry.status.in_(['W', 'H'])
+    ).first()
+
+
+def position(entry):
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.lot_id == entry.lot_id,
+        WaitlistEntry.status == 'W',
+        WaitlistEntry.id <= entry.id
+    ).count()
+
+
+def join(user_id, lot):
+    """Queue the user for `lot`, returning their entry or None if the queue is full"""
+    entry = active_entry(user_id, lot.id)
+    if entry:
+        return entry
+    waiting = WaitlistEntry.query.filter_by(lot_id=lot.id, status='W').count()
+    if waiting >= MAX_WAITLIST:
+        return None
+    entry = WaitlistEntry(lot_id=lot.id, user_id=user_id, status='W')
+    db.session.add(entry)
+    db.session.flush()
+    return entry
+
+
+def hand_off(spot, now=None):
+    """Give a freed spot to the next waiting user, or mark it available"""
+    now = now or datetime.now()
+    entry = WaitlistEntry.query.filter_by(lot_id=spot.lot_id, status='W') \
+        .order_by(WaitlistEntry.created_at, WaitlistEntry.id).first()
+    if not entry:
+        spot.status = 'A'
+        return None
+    entry.status = 'H'
+    entry.spot_id = spot.id
+    entry.hold_expires_at = now + timedelta(minutes=HOLD_MINUTES)
+    spot.status = 'H'
+    return entry
+
+
+def expire_holds(lot_id, now=None):
+    """Pass spots from lapsed holds on to the next user in the queue"""
+    now = now or datetime.now()
+    query = WaitlistEntry.query.filter(
+        WaitlistEntry.lot_id == lot_id,
+        WaitlistEntry.status == 'H',
+        WaitlistEntry.hold_expires_at <= now
+    ).order_by(WaitlistEntry.hold_expires_at)
+    if not query.first():
+        return 0
+    # Dashboards call this too, so take the lock and re-read before handing off
+    lock_lot(lot_id)
+    expired = query.populate_existing().all()
+    for entry in expired:
+        entry.status = 'X'
+        hand_off(entry.spot, now)
+    return len(expired)
+
+
+def parked(user_id, lot_id, reservations, now=None):
+    """Drop the user's queue entry once one of `reservations` gives them a spot now.
+
+    Without this a user who booked another way would later be handed a
+    hold they do not need, blocking the spot for HOLD_MINUTES.
+    """
+    now = now or datetime.now()
+    if not any(r.parking_time <= now and (r.leaving_time is None or r.leaving_time > now)
+               for r in reservations):
+        return None
+    entry = active_entry(user_id, lot_id)
+    if entry:
+        leave(entry, now)
+    return entry
+
+
+def claim(entry, now=None):
+    """Turn a held spot into an open-ended reservation for the waiting user.
+
+    Raises ValueError if the hold has lapsed or was already claimed, or if neither the held spot
+    nor any other spot is free without overlapping a later reservation.
+    """
+    now = now or datetime.now()
+    lock_lot(entry.lot_id)
+    # Re-read under the lock; a concurrent claim of the same entry may have won
+    db.session.refresh(entry)
+    if entry.status == 'C':
+        raise ValueError('You have already claimed this spot.')
+    if entry.status != 'H' or entry.hold_expires_at <= now:
+        raise ValueError('Your hold on this spot has expired.')
+    spot = entry.spot
+    db.session.refresh(spot)
+    if has_conflict(spot, now):
+        # The held spot is booked later on; it stays bookable for shorter windows
+        if spot.status == 'H':
+            spot.status = 'A'
+        free = find_free_spots(entry.lot, now, None, 1, now)
+        if not free:
+            entry.status = 'W'
+            entry.spot_id = None
+            entry.hold_expires_at = None
+            raise ValueError('The held spot is reserved later on and no other spot is free. '
+                             'You are back on the waitlist.')
+        spot = free[0]
+    spot.status = 'O'
+    entry.status = 'C'
+    entry.spot_id = spot.id
+    reservation = Reservation(
+        spot_id=spot.id,
+        user_id=entry.user_id,
+        parking_time=now,
+        cost_per_hour=spot.lot.price_per_hour
+    )
+    db.session.add(reservation)
+    return reservation
+
+
+def leave(entry, now=None):
+    entry.status = 'X'
+    if entry.spot_id:
+        hand_off(entry.spot, now)
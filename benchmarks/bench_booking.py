@@ -0,0 +1,94 @@
+"""Compare batch booking against the equivalent sequence of single bookings.
+
+Both sides go through the real routes with the test client: single bookings
+POST to /book/<lot_id>/confirm once per spot or day, each in its own
+transaction, and the batch POSTs once to /book/<lot_id>/batch.
+
+Run from the project root:  python benchmarks/bench_booking.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.booking import recurring_windows
+from app.models import User, ParkingLot, ParkingSpot, Reservation
+
+SPOTS = 40
+OCCURRENCES = 20
+
+
+def setup_lot():
+    lot = ParkingLot(prime_location_name='Bench Lot', price_per_hour=20.0,
+                     address='Bench Street', pincode='000000', max_spots=SPOTS)
+    db.session.add(lot)
+    db.session.flush()
+    db.session.add_all([ParkingSpot(lot_id=lot.id) for _ in range(SPOTS)])
+    user = User(full_name='Bench', username='bench', email='bench@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user, lot
+
+
+def reset():
+    Reservation.query.delete()
+    ParkingSpot.query.update({'status': 'A'})
+    db.session.commit()
+
+
+def timed(label, fn, bookings):
+    reset()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    assert Reservation.query.count() == bookings
+    print(f"{label:<40} {elapsed * 1000:8.1f} ms  {bookings / elapsed:8.0f} bookings/s")
+
+
+def form_time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'RATELIMIT_ENABLED': False,
+        })
+        with app.app_context():
+            db.create_all()
+            user, lot = setup_lot()
+            user_id, lot_id = user.id, lot.id
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+        start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        end = start + timedelta(hours=2)
+        series = recurring_windows(start, end, 'weekdays', OCCURRENCES)
+
+        def single(windows):
+            for s, e in windows:
+                client.post(f'/book/{lot_id}/confirm',
+                            data={'start_time': form_time(s), 'end_time': form_time(e)})
+
+        def batch(count, repeat, occurrences):
+            client.post(f'/book/{lot_id}/batch', data={
+                'count': count, 'start_time': form_time(start), 'end_time': form_time(end),
+                'repeat': repeat, 'occurrences': occurrences,
+            })
+
+        with app.app_context():
+            timed(f"{SPOTS} spots, single bookings", lambda: single([(start, end)] * SPOTS), SPOTS)
+            timed(f"{SPOTS} spots, one batch", lambda: batch(SPOTS, 'none', 1), SPOTS)
+            timed(f"{OCCURRENCES} weekdays, single bookings", lambda: single(series), OCCURRENCES)
+            timed(f"{OCCURRENCES} weekdays, one batch", lambda: batch(1, 'weekdays', OCCURRENCES), OCCURRENCES)
+
+
+if __name__ == '__main__':
+    main()
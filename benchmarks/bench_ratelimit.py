@@ -0,0 +1,60 @@
+"""Measure per-request overhead of the rate and concurrency limiters.
+
+Run from the project root:  python benchmarks/bench_ratelimit.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.ratelimit import limiter, MemoryBackend, SqliteBackend
+
+ITERATIONS = 20000
+
+
+def timed(label, fn, iterations=ITERATIONS):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed / iterations * 1e6:8.2f} us/call")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+
+        def view():
+            return 'ok'
+
+        # Huge budget so every call takes the allow path
+        limited = limiter.limit('bench', per_minute=10 ** 9, burst=10 ** 9)(view)
+        guarded = limiter.concurrency('bench', max_in_flight=4)(view)
+
+        memory = MemoryBackend()
+        timed('MemoryBackend.consume', lambda: memory.consume('k', 1e6, 1e6, time.time()))
+
+        # Past MAX_KEYS with no bucket refilled, so every new key forces pruning
+        crowded = MemoryBackend()
+        for i in range(crowded.MAX_KEYS + 2000):
+            crowded.consume(f'fill{i}', 1e-6, 5, time.time())
+        new_keys = iter(range(10 ** 9))
+        timed('MemoryBackend.consume, new keys at MAX_KEYS',
+              lambda: crowded.consume(f'new{next(new_keys)}', 1e-6, 5, time.time()))
+        shared = SqliteBackend(os.path.join(tmp, 'ratelimit.db'))
+        timed('SqliteBackend.consume', lambda: shared.consume('k', 1e6, 1e6, time.time()), 2000)
+
+        with app.test_request_context('/book/1', method='POST', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            limiter.init_app(app, backend=MemoryBackend())
+            timed('bare view', view)
+            timed('rate limited view (memory backend)', limited)
+            timed('concurrency limited view', guarded)
+            limiter.init_app(app, backend=SqliteBackend(os.path.join(tmp, 'ratelimit.db')))
+            timed('rate limited view (sqlite backend)', limited, 2000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Measure worker cold-start time for the Slotlyapp entry point.
+
+Each run starts a fresh interpreter, so imports, app creation and the
+prepare_worker hook are all paid from scratch, as they are for a new worker.
+
+Run from the project root:  python benchmarks/bench_startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 10
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+from app.catalog import prepare_worker
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+prepare_worker(app)
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'prepare_worker': t3 - t2, 'total': t3 - t0}))
+"""
+
+
+def main():
+    samples = []
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    for phase in ('import', 'create_app', 'prepare_worker', 'total'):
+        values = [s[phase] * 1000 for s in samples]
+        print(f"{phase:<16} median {statistics.median(values):7.1f} ms  max {max(values):7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
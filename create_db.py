@@ -1,4 +1,5 @@
 from app import create_app, db
+from app import models  # noqa: F401  registers every table on db.metadata
 
 app = create_app()
 